@@ -0,0 +1,227 @@
+# fisher_gui_st
+
+# ===============================================================
+# 🧩 Fisher's Exact Test App - Shared Core
+# Author: Yuuji Miyahara
+# Description:
+#   fisher_gui_st_1.2.py / fisher_gui_st_1.205.py で共通の
+#   検定・キャッシュ・コメント生成・グラフ描画処理。
+#   キャッシュ関数をここに集約し、両アプリで同じキャッシュを共有する。
+# ===============================================================
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+import io
+import itertools
+
+# ===============================================================
+# 🧮 Fisher検定（結果キャッシュ付き）
+# ===============================================================
+@st.cache_data(max_entries=4096)
+def _fisher_exact_cached(a, b, c, d):
+    """正規化済み2×2表に対するFisher検定（結果をキャッシュ）"""
+    from scipy.stats import fisher_exact
+    oddsratio, p_val = fisher_exact([[a, b], [c, d]])
+    return float(oddsratio), float(p_val)
+
+
+def _canonical_table(a, b, c, d):
+    """2×2表を行・列の入れ替えで正規化し、(正規化した表, オッズ比が逆数になるか) を返す
+
+    行・列の入れ替え（abcd ≡ badc ≡ cdab ≡ dcba）では両側p値が変わらないため、
+    正規化した表をキャッシュキーにすれば群1/群2を入れ替えた場合も結果を再利用できる。
+    """
+    return min([
+        ((a, b, c, d), False),
+        ((b, a, d, c), True),
+        ((c, d, a, b), True),
+        ((d, c, b, a), False),
+    ])
+
+
+def cached_fisher(a, b, c, d):
+    """2×2表 [[a, b], [c, d]] のFisher検定を実行
+
+    正規化した表で結果をキャッシュし、行または列だけを入れ替えた表では
+    オッズ比が逆数になるので補正して返す。
+    """
+    key, flipped = _canonical_table(a, b, c, d)
+    oddsratio, p_val = _fisher_exact_cached(*key)
+    if flipped:
+        oddsratio = np.inf if oddsratio == 0 else 1.0 / oddsratio
+    return oddsratio, p_val
+
+
+def pairwise_fisher(file_key, df, names):
+    """指定カラムの全組合せについてFisher検定を行い、p値の対称行列を返す
+
+    不良数は2群比較と同じ clean_int_col で数え、正規化後に同じになる表は1回だけ計算する。
+    """
+    counts = []
+    for name in names:
+        arr = clean_int_col(file_key, name, df)
+        fail = int(np.count_nonzero(arr))
+        counts.append((fail, arr.size - fail))
+
+    p_matrix = pd.DataFrame(np.nan, index=names, columns=names)
+    p_by_key = {}
+    for i, j in itertools.combinations(range(len(names)), 2):
+        key = _canonical_table(*counts[i], *counts[j])[0]
+        if key not in p_by_key:
+            p_by_key[key] = _fisher_exact_cached(*key)[1]
+        p_matrix.iat[i, j] = p_matrix.iat[j, i] = p_by_key[key]
+    return p_matrix
+
+
+# ===============================================================
+# 📂 ファイル読み込み（アップロード内容ごとにキャッシュ）
+# ===============================================================
+# キャッシュはサーバー全体で共有されるため、件数と保持時間を絞っておく
+@st.cache_data(max_entries=8, ttl=3600)
+def load_table(name, raw):
+    """アップロードされたCSV/Excelを読み込み（同じファイルなら再解析しない）"""
+    buf = io.BytesIO(raw)
+    return pd.read_csv(buf) if name.endswith(".csv") else pd.read_excel(buf)
+
+
+@st.cache_data(max_entries=64, ttl=3600)
+def clean_int_col(file_key, name, _df):
+    """指定カラムを欠損除去して 0/1 の整数配列に変換（ファイル・カラムごとにキャッシュ）
+
+    DataFrame 自体はハッシュせず、アップロードファイルのIDとカラム名をキーにする。
+    すでに NumPy 整数型のカラムはそのまま使い、それ以外（0.0/1.0 の float、
+    Int64 などの拡張型、"0"/"1" の文字列など）は float64 経由で int8 に変換する。
+    """
+    col = _df[name].dropna()
+    if pd.api.types.is_integer_dtype(col.dtype) and isinstance(col.dtype, np.dtype):
+        arr = col.to_numpy()
+        # 0/1 以外の値があるときだけ clip する（元データを書き換えないよう新しい配列に出力）
+        if arr.size and (arr.min() < 0 or arr.max() > 1):
+            arr = np.clip(arr, 0, 1)
+    else:
+        # int8 に落とす前に [0, 1] に収める（200.0 などが桁あふれしないように）
+        arr = np.clip(col.to_numpy(dtype=np.float64), 0, 1).astype(np.int8)
+    return arr
+
+
+@st.cache_data(max_entries=8, ttl=3600)
+def binary_columns(file_key, _df):
+    """値が 0/1 だけ（欠損は除く）の数値カラム名を返す（ファイルごとにキャッシュ）
+
+    すべて欠損のカラムは 0/1 データとみなさない。
+    """
+    names = []
+    for name in _df.select_dtypes("number").columns:
+        col = _df[name].dropna()
+        if col.size and col.isin([0, 1]).all():
+            names.append(name)
+    return names
+
+
+# ===============================================================
+# 💬 コメント文テンプレート（目的 × 有意差の有無で引く）
+# ===============================================================
+PURPOSE_EQUAL = "差がなくなることを期待（同等を目指す）"
+PURPOSE_IMPROVE = "差が出ることを期待（改良・強化を目指す）"
+
+MAIN_RESULTS = {
+    True: "群2（{name2}）の不良率 {rate2:.2f}% は、群1（{name1}）と比較して有意に異なります。",
+    False: "群2（{name2}）の不良率 {rate2:.2f}% は、群1（{name1}）と比較して統計的に有意な差は認められません。",
+}
+SIGNIFICANCES = {
+    True: "p値 = {p_val:.4f} ＜ α = {alpha:.3f} → **統計的に有意な差あり**。",
+    False: "p値 = {p_val:.4f} ≥ α = {alpha:.3f} → **統計的に有意な差なし**。",
+}
+SIG_NOTES = {
+    (PURPOSE_EQUAL, True): "有意差が確認されたため、**対策効果が不十分**の可能性があります。",
+    (PURPOSE_EQUAL, False): "有意差が見られなかったため、**同等化達成の可能性**が示唆されます。",
+    (PURPOSE_IMPROVE, True): "有意差が確認されたため、**改良効果が確認された結果**です。",
+    (PURPOSE_IMPROVE, False): "有意差が見られなかったため、**改良効果は確認されませんでした。**",
+}
+
+
+def render_comment(name1, name2, rate2, p_val, alpha, purpose):
+    """報告書転記用のコメント文を生成"""
+    sig = p_val < alpha
+    main_result = MAIN_RESULTS[sig].format(name1=name1, name2=name2, rate2=rate2)
+    significance = SIGNIFICANCES[sig].format(p_val=p_val, alpha=alpha)
+    note = SIG_NOTES[(purpose, sig)]
+    return f"{main_result}\n{significance}\n\n📘 {note}"
+
+
+def run_fisher(f1, ok1, f2, ok2):
+    """2群の不良数・良品数から検定を行い、(オッズ比, p値, 不良率1, 不良率2) を返す"""
+    n1, n2 = f1 + ok1, f2 + ok2
+    if min(f1, ok1, f2, ok2) >= 0 and (f1 + f2 == 0 or ok1 + ok2 == 0 or n1 == 0 or n2 == 0):
+        # 行または列の合計が0の表は p値 = 1 が確定するため、検定を省略する
+        # （負のセルを含む不正な表は fisher_exact に渡して ValueError にする）
+        oddsratio, p_val = float("nan"), 1.0
+    else:
+        oddsratio, p_val = cached_fisher(int(f1), int(ok1), int(f2), int(ok2))
+    rate1 = f1 / n1 * 100 if n1 else 0.0
+    rate2 = f2 / n2 * 100 if n2 else 0.0
+    return oddsratio, p_val, rate1, rate2
+
+
+def load_last_result(key):
+    """入力が直前の検定と同じなら st.session_state に保存した結果を返す（違えば None）"""
+    if st.session_state.get("last_key") == key:
+        return st.session_state.last_result
+    return None
+
+
+def save_last_result(key, result):
+    """検定結果を入力キーとともに st.session_state に保存して返す"""
+    st.session_state.last_key = key
+    st.session_state.last_result = result
+    return result
+
+
+# ===============================================================
+# 📈 グラフ描画
+# ===============================================================
+def get_session_figure():
+    """棒グラフ用の Figure / Axes を返す（セッション内で使い回し、初回のみ生成）
+
+    pyplot を通さずに作るため、セッション終了時に session_state とともに解放される。
+    """
+    from matplotlib.figure import Figure
+    if "fig" not in st.session_state:
+        st.session_state.fig = Figure(figsize=(5, 3))
+        st.session_state.ax = st.session_state.fig.subplots()
+    return st.session_state.fig, st.session_state.ax
+
+
+def render_bar_plot(ax, names, rates, ylabel="Defect Rate (%)", title="Comparison of Two Groups",
+                    fontproperties=None):
+    """2群の不良率を棒グラフで描画（使い回しの Axes をクリアしてから描く）"""
+    ax.clear()
+    ax.bar(names, rates, color=["skyblue", "orange"])
+    ax.set_ylabel(ylabel, fontproperties=fontproperties)
+    ax.set_title(title, fontproperties=fontproperties)
+    top = max(rates)
+    ax.set_ylim(0, top * 1.4 if top > 0 else 1)
+    labels = [f"{v:.2f}%" for v in rates]
+    for i, (v, lbl) in enumerate(zip(rates, labels)):
+        ax.text(i, v + 0.3, lbl, ha='center', fontsize=10, fontproperties=fontproperties)
+
+
+def show_pvalue_heatmap(p_matrix, alpha, fontproperties=None):
+    """全ペア比較のp値行列をヒートマップで表示（* は p ＜ α）"""
+    import matplotlib.pyplot as plt
+
+    names = p_matrix.columns.tolist()
+    k = len(names)
+    fig, ax = plt.subplots(figsize=(max(4, 0.8 * k + 1), max(3, 0.8 * k)))
+    im = ax.imshow(p_matrix.to_numpy(), cmap="RdYlGn", vmin=0, vmax=1)
+    ax.set_xticks(range(k), names, rotation=45, ha="right")
+    ax.set_yticks(range(k), names)
+    for i, j in itertools.permutations(range(k), 2):
+        p = p_matrix.iat[i, j]
+        ax.text(j, i, f"{p:.3f}{'*' if p < alpha else ''}", ha="center", va="center", fontsize=8,
+                fontproperties=fontproperties)
+    fig.colorbar(im, ax=ax, label="p-value")
+    ax.set_title("Pairwise Fisher's Exact Test (p-values)")
+    st.pyplot(fig)
+    plt.close(fig)
@@ -14,10 +14,22 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from scipy.stats import fisher_exact
-import matplotlib.pyplot as plt
 import io
-import xlsxwriter
+from fisher_core import (
+    PURPOSE_EQUAL,
+    PURPOSE_IMPROVE,
+    binary_columns,
+    clean_int_col,
+    get_session_figure,
+    load_last_result,
+    load_table,
+    pairwise_fisher,
+    render_bar_plot,
+    render_comment,
+    run_fisher,
+    save_last_result,
+    show_pvalue_heatmap,
+)
 
 # ---------------------------------
 # Page Settings
@@ -45,7 +57,7 @@ mode = st.radio("入力方法を選択してください：", ("📁 ファイ
 alpha = st.slider("有意水準（α）", 0.001, 0.10, 0.05, step=0.001)
 purpose = st.radio(
     "今回の試作の目的を選択してください：",
-    ("差がなくなることを期待（同等を目指す）", "差が出ることを期待（改良・強化を目指す）"),
+    (PURPOSE_EQUAL, PURPOSE_IMPROVE),
     horizontal=True
 )
 
@@ -56,10 +68,7 @@ if mode == "📁 ファイルから":
     uploaded_file = st.file_uploader("CSVまたはExcelファイルをアップロード", type=["csv", "xlsx"])
 
     if uploaded_file:
-        if uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        df = load_table(uploaded_file.name, uploaded_file.getvalue())
 
         st.subheader("✏️ データプレビュー")
         st.dataframe(df.head())
@@ -67,45 +76,36 @@ if mode == "📁 ファイルから":
         colnames = df.columns.tolist()
         col1 = st.selectbox("群1のカラム名", colnames)
         col2 = st.selectbox("群2のカラム名", colnames, index=1 if len(colnames) > 1 else 0)
+        want_excel = st.checkbox("Excelファイル（.xlsx）も出力する", value=False)
 
-        if st.button("⚖️ 検定を実行（ファイル入力）"):
-            data1 = df[col1].dropna().astype(int)
-            data2 = df[col2].dropna().astype(int)
-
-            fail1, ok1 = data1.sum(), len(data1) - data1.sum()
-            fail2, ok2 = data2.sum(), len(data2) - data2.sum()
-
-            table = [[fail1, ok1], [fail2, ok2]]
-            oddsratio, p_val = fisher_exact(table)
-            rate1, rate2 = fail1 / len(data1) * 100, fail2 / len(data2) * 100
-
-            # ----- 結果コメント生成 -----
-            if p_val < alpha:
-                main_result = f"群2（{col2}）の不良率 {rate2:.2f}% は、群1（{col1}）と比較して有意に異なります。"
-                significance = f"p値 = {p_val:.4f} ＜ α = {alpha:.3f} → **統計的に有意な差あり**。"
-            else:
-                main_result = f"群2（{col2}）の不良率 {rate2:.2f}% は、群1（{col1}）と比較して統計的に有意な差は認められません。"
-                significance = f"p値 = {p_val:.4f} ≥ α = {alpha:.3f} → **統計的に有意な差なし**。"
-
-            if purpose == "差がなくなることを期待（同等を目指す）":
-                note = (
-                    "有意差が見られなかったため、**同等化達成の可能性**が示唆されます。"
-                    if p_val >= alpha
-                    else "有意差が確認されたため、**対策効果が不十分**の可能性があります。"
-                )
-            else:
-                note = (
-                    "有意差が確認されたため、**改良効果が確認された結果**です。"
-                    if p_val < alpha
-                    else "有意差が見られなかったため、**改良効果は確認されませんでした。**"
-                )
+        submitted = st.button("⚖️ 検定を実行（ファイル入力）")
+
+        # 入力が前回の検定と同じなら、保存済みの結果から再描画する（再計算しない）
+        last_key = ("file", uploaded_file.file_id, col1, col2)
+        result = load_last_result(last_key)
+
+        if submitted or result is not None:
+            if result is None:
+                # 0/1 の整数配列として取り出し、非ゼロ要素数をそのまま不良数とする
+                arr1 = clean_int_col(uploaded_file.file_id, col1, df)
+                arr2 = clean_int_col(uploaded_file.file_id, col2, df)
 
-            result_text = f"{main_result}\n{significance}\n\n📘 {note}"
+                n1, n2 = arr1.size, arr2.size
+                fail1 = int(np.count_nonzero(arr1))
+                fail2 = int(np.count_nonzero(arr2))
+
+                oddsratio, p_val, rate1, rate2 = run_fisher(fail1, n1 - fail1, fail2, n2 - fail2)
+                result = save_last_result(last_key, (fail1, n1, fail2, n2, oddsratio, p_val, rate1, rate2))
+
+            fail1, n1, fail2, n2, oddsratio, p_val, rate1, rate2 = result
+            ok1, ok2 = n1 - fail1, n2 - fail2
+            # α・目的はコメントにしか影響しないため、コメントは毎回作り直す
+            result_text = render_comment(col1, col2, rate2, p_val, alpha, purpose)
 
             # ----- 結果表示 -----
             st.markdown("### ✅ 検定結果")
-            st.write(f"{col1}: 不良 {fail1} / n={len(data1)} → {rate1:.2f}%")
-            st.write(f"{col2}: 不良 {fail2} / n={len(data2)} → {rate2:.2f}%")
+            st.write(f"{col1}: 不良 {fail1} / n={n1} → {rate1:.2f}%")
+            st.write(f"{col2}: 不良 {fail2} / n={n2} → {rate2:.2f}%")
             st.write(f"オッズ比: {oddsratio:.3f}")
             st.write(f"p値: {p_val:.5f}")
 
@@ -114,32 +114,50 @@ if mode == "📁 ファイルから":
 
             # ----- グラフ (英語表記) -----
             st.markdown("### 📈 Defect Rate Comparison (English Graph)")
-            fig, ax = plt.subplots(figsize=(5, 3))
-            ax.bar([col1, col2], [rate1, rate2], color=["skyblue", "orange"])
-            ax.set_ylabel("Defect Rate (%)")
-            ax.set_title("Comparison of Two Groups")
-            ax.set_ylim(0, max(rate1, rate2) * 1.4 if max(rate1, rate2) > 0 else 1)
-            for i, v in enumerate([rate1, rate2]):
-                ax.text(i, v + 0.3, f"{v:.2f}%", ha='center', fontsize=10)
-            st.pyplot(fig)
-
-            # ----- Excel出力 -----
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                df_out = pd.DataFrame({
-                    "Group": [col1, col2],
-                    "Defects": [fail1, fail2],
-                    "Good": [ok1, ok2],
-                    "Defect Rate(%)": [rate1, rate2],
-                    "Sample Size": [len(data1), len(data2)]
-                })
-                df_out.to_excel(writer, sheet_name="Fisher_Result", index=False)
+            fig, ax = get_session_figure()
+            render_bar_plot(ax, [col1, col2], [rate1, rate2])
+            st.pyplot(fig, clear_figure=False)
+
+            # ----- 結果出力（CSV / 必要時のみExcel） -----
+            df_out = pd.DataFrame({
+                "Group": [col1, col2],
+                "Defects": [fail1, fail2],
+                "Good": [ok1, ok2],
+                "Defect Rate(%)": [rate1, rate2],
+                "Sample Size": [n1, n2]
+            })
+            # utf-8-sig: Excelで開いても日本語のカラム名が文字化けしないようにBOMを付ける
             st.download_button(
-                "📥 Download as Excel",
-                output.getvalue(),
-                "fisher_result.xlsx",
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                "📥 Download as CSV",
+                df_out.to_csv(index=False).encode("utf-8-sig"),
+                "fisher_result.csv",
+                "text/csv"
             )
+            if want_excel:
+                import xlsxwriter  # Excel出力を選んだときだけ読み込む
+
+                output = io.BytesIO()
+                with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+                    df_out.to_excel(writer, sheet_name="Fisher_Result", index=False)
+                st.download_button(
+                    "📥 Download as Excel",
+                    output.getvalue(),
+                    "fisher_result.xlsx",
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
+        # ----- 全ペア比較 -----
+        st.markdown("### 🔀 全ペア比較（多群ファイル向け）")
+        numeric_cols = df.select_dtypes("number").columns.tolist()
+        pair_cols = st.multiselect("比較するカラム（0/1データ）", numeric_cols, default=binary_columns(uploaded_file.file_id, df))
+
+        if st.button("🔀 全ペアを検定", disabled=len(pair_cols) < 2):
+            p_matrix = pairwise_fisher(uploaded_file.file_id, df, pair_cols)
+
+            st.write(f"p値行列（* は p ＜ α = {alpha:.3f}）")
+            st.dataframe(p_matrix.style.format("{:.4f}", na_rep="-"))
+
+            show_pvalue_heatmap(p_matrix, alpha)
     else:
         st.info("ファイルをアップロードすると検定を実行できます。")
 
@@ -160,34 +178,25 @@ else:
         n2 = st.number_input("群2の総サンプル数", min_value=1, value=100)
         f2 = st.number_input("群2の不良数", min_value=0, value=3)
 
-    if st.button("⚖️ 検定を実行（集計値入力）"):
-        ok1, ok2 = n1 - f1, n2 - f2
-        table = [[f1, ok1], [f2, ok2]]
-        oddsratio, p_val = fisher_exact(table)
-        rate1, rate2 = f1 / n1 * 100, f2 / n2 * 100
-
-        # ----- コメント生成 -----
-        if p_val < alpha:
-            main_result = f"群2（{name2}）の不良率 {rate2:.2f}% は、群1（{name1}）と比較して有意に異なります。"
-            significance = f"p値 = {p_val:.4f} ＜ α = {alpha:.3f} → **統計的に有意な差あり**。"
-        else:
-            main_result = f"群2（{name2}）の不良率 {rate2:.2f}% は、群1（{name1}）と比較して統計的に有意な差は認められません。"
-            significance = f"p値 = {p_val:.4f} ≥ α = {alpha:.3f} → **統計的に有意な差なし**。"
-
-        if purpose == "差がなくなることを期待（同等を目指す）":
-            note = (
-                "有意差が見られなかったため、**同等化達成の可能性**が示唆されます。"
-                if p_val >= alpha
-                else "有意差が確認されたため、**対策効果が不十分**の可能性があります。"
-            )
-        else:
-            note = (
-                "有意差が確認されたため、**改良効果が確認された結果**です。"
-                if p_val < alpha
-                else "有意差が見られなかったため、**改良効果は確認されませんでした。**"
-            )
+    submitted = st.button("⚖️ 検定を実行（集計値入力）")
+
+    # 不良数がサンプル数を超える表は検定できないため、ここで止める
+    if f1 > n1 or f2 > n2:
+        st.error("不良数が総サンプル数を超えています。入力を確認してください。")
+        st.stop()
+
+    # 入力が前回の検定と同じなら、保存済みの結果から再描画する（再計算しない）
+    last_key = ("manual", name1, n1, f1, name2, n2, f2)
+    result = load_last_result(last_key)
+
+    if submitted or result is not None:
+        if result is None:
+            oddsratio, p_val, rate1, rate2 = run_fisher(f1, n1 - f1, f2, n2 - f2)
+            result = save_last_result(last_key, (oddsratio, p_val, rate1, rate2))
 
-        result_text = f"{main_result}\n{significance}\n\n📘 {note}"
+        oddsratio, p_val, rate1, rate2 = result
+        # α・目的はコメントにしか影響しないため、コメントは毎回作り直す
+        result_text = render_comment(name1, name2, rate2, p_val, alpha, purpose)
 
         # ----- 結果表示 -----
         st.markdown("### ✅ 検定結果")
@@ -201,13 +210,8 @@ else:
 
         # ----- グラフ (英語表記) -----
         st.markdown("### 📈 Defect Rate Comparison (English Graph)")
-        fig, ax = plt.subplots(figsize=(5, 3))
-        ax.bar([name1, name2], [rate1, rate2], color=["skyblue", "orange"])
-        ax.set_ylabel("Defect Rate (%)")
-        ax.set_title("Comparison of Two Groups")
-        ax.set_ylim(0, max(rate1, rate2) * 1.4 if max(rate1, rate2) > 0 else 1)
-        for i, v in enumerate([rate1, rate2]):
-            ax.text(i, v + 0.3, f"{v:.2f}%", ha='center', fontsize=10)
-        st.pyplot(fig)
+        fig, ax = get_session_figure()
+        render_bar_plot(ax, [name1, name2], [rate1, rate2])
+        st.pyplot(fig, clear_figure=False)
 
         st.success("検定完了。結果を報告書にご活用ください。")
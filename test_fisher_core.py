@@ -0,0 +1,149 @@
+# fisher_gui_st
+
+# ===============================================================
+# 🧪 fisher_core のテスト（python -m pytest -q）
+# ===============================================================
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import fisher_exact
+
+from fisher_core import (
+    PURPOSE_EQUAL,
+    PURPOSE_IMPROVE,
+    SIG_NOTES,
+    _canonical_table,
+    binary_columns,
+    cached_fisher,
+    clean_int_col,
+    pairwise_fisher,
+    render_comment,
+    run_fisher,
+)
+
+TABLES = [
+    (5, 95, 3, 97),
+    (0, 10, 4, 6),     # オッズ比 0
+    (7, 0, 2, 5),      # オッズ比 inf
+    (0, 0, 3, 4),      # オッズ比 nan
+    (12, 3, 12, 3),
+]
+
+
+def orientations(a, b, c, d):
+    """行・列の入れ替えで得られる4通りの表"""
+    return [(a, b, c, d), (b, a, d, c), (c, d, a, b), (d, c, b, a)]
+
+
+def assert_same_float(actual, expected):
+    if math.isnan(expected):
+        assert math.isnan(actual)
+    else:
+        assert actual == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("table", TABLES)
+def test_cached_fisher_matches_scipy_for_all_orientations(table):
+    for a, b, c, d in orientations(*table):
+        expected_or, expected_p = fisher_exact([[a, b], [c, d]])
+        oddsratio, p_val = cached_fisher(a, b, c, d)
+        assert_same_float(oddsratio, expected_or)
+        assert p_val == pytest.approx(expected_p)
+
+
+@pytest.mark.parametrize("table", TABLES)
+def test_canonical_table_is_shared_by_all_orientations(table):
+    keys = {_canonical_table(*t)[0] for t in orientations(*table)}
+    assert len(keys) == 1
+
+
+def test_canonical_table_flags_single_axis_swaps():
+    # 正規化後の表自体は反転なし、行だけ・列だけの入れ替えは反転あり
+    assert _canonical_table(1, 2, 3, 4) == ((1, 2, 3, 4), False)
+    assert _canonical_table(2, 1, 4, 3) == ((1, 2, 3, 4), True)
+    assert _canonical_table(3, 4, 1, 2) == ((1, 2, 3, 4), True)
+    assert _canonical_table(4, 3, 2, 1) == ((1, 2, 3, 4), False)
+
+
+def test_cached_fisher_inverts_zero_and_keeps_nan():
+    assert cached_fisher(0, 10, 4, 6)[0] == 0
+    assert cached_fisher(4, 6, 0, 10)[0] == np.inf
+    assert math.isnan(cached_fisher(0, 0, 3, 4)[0])
+    assert math.isnan(cached_fisher(3, 4, 0, 0)[0])
+
+
+@pytest.mark.parametrize("purpose", [PURPOSE_EQUAL, PURPOSE_IMPROVE])
+@pytest.mark.parametrize("p_val, sig", [(0.01, True), (0.2, False)])
+def test_render_comment_picks_note_by_purpose_and_significance(purpose, p_val, sig):
+    text = render_comment("A", "B", 3.0, p_val, 0.05, purpose)
+    assert text.endswith(SIG_NOTES[(purpose, sig)])
+    assert ("有意に異なります" in text) is sig
+
+
+def test_sig_notes_cover_every_purpose_and_outcome():
+    assert set(SIG_NOTES) == {
+        (purpose, sig) for purpose in (PURPOSE_EQUAL, PURPOSE_IMPROVE) for sig in (True, False)
+    }
+
+
+def test_run_fisher_short_circuits_degenerate_tables():
+    oddsratio, p_val, rate1, rate2 = run_fisher(0, 50, 0, 40)
+    assert math.isnan(oddsratio)
+    assert p_val == 1.0
+    assert (rate1, rate2) == (0.0, 0.0)
+
+
+def test_run_fisher_rejects_negative_cells():
+    # 不良数 > N（良品数が負）の表は p = 1 に丸めず、baseline と同じく ValueError にする
+    with pytest.raises(ValueError):
+        run_fisher(10, -5, 0, 5)
+
+
+def test_clean_int_col_clips_floats_before_downcast():
+    df = pd.DataFrame({"x": [0.0, 1.0, 200.0, 256.0, -3.0, np.nan]})
+    arr = clean_int_col("test-clip", "x", df)
+    assert arr.tolist() == [0, 1, 1, 1, 0]
+
+
+@pytest.mark.parametrize("values, dtype", [
+    ([0, 1, 1, None, 0], "Int64"),
+    (["0", "1", "1", None, "0"], "string"),
+])
+def test_clean_int_col_accepts_extension_dtypes(values, dtype):
+    df = pd.DataFrame({"x": pd.Series(values, dtype=dtype)})
+    arr = clean_int_col(f"test-{dtype}", "x", df)
+    assert arr.tolist() == [0, 1, 1, 0]
+
+
+def test_binary_columns_skips_non_binary_and_all_nan_columns():
+    df = pd.DataFrame({
+        "ok": [0, 1, 1, 0],
+        "ok_float": [0.0, 1.0, np.nan, 1.0],
+        "id": [101, 102, 103, 104],
+        "empty": [np.nan] * 4,
+        "label": ["a", "b", "c", "d"],
+    })
+    assert binary_columns("test-binary", df) == ["ok", "ok_float"]
+
+
+def test_pairwise_fisher_is_symmetric_and_matches_cached_fisher():
+    df = pd.DataFrame({
+        "a": [1, 0, 0, 0, 1, 0, 0, 0],
+        "b": [1, 1, 1, 0, 1, 1, 0, 1],
+        "c": [0, 0, 0, 0, 0, 0, 1, 0],
+        "d": [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, np.nan],
+    })
+    names = df.columns.tolist()
+    p_matrix = pairwise_fisher("test-pairwise", df, names)
+
+    values = p_matrix.to_numpy()
+    assert np.isnan(np.diag(values)).all()
+    np.testing.assert_array_equal(values, values.T)
+
+    counts = {name: (int(df[name].sum()), int(df[name].count() - df[name].sum())) for name in names}
+    for i, j in [(0, 1), (1, 2), (0, 3)]:
+        expected = cached_fisher(*counts[names[i]], *counts[names[j]])[1]
+        assert p_matrix.iat[i, j] == pytest.approx(expected)